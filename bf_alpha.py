@@ -25,8 +25,8 @@ selected, af2 would add 1 to the last cell, so [0 0 *0* 0 3].
 `mf` and `mb` move the current value to the cell specified by their
 arguments, meaning they zero that cell then add the current one into it.
 '''
-import itertools as it
 import sys
+from functools import lru_cache
 import brainfuck
 from brainfuck import Memory
 OLD_TOKENS = ['+', '-', '<', '>', '[', ']', ',', '.']
@@ -67,17 +67,32 @@ def fixed_point_translation(s):
         return s
     return fixed_point_translation(result)
 
+@lru_cache(maxsize=None)
+def expand_family(family, direction, arg):
+    '''Compile one command from `TOKEN_FAMILIES` to brainfuck
+
+    Since some of these use BF Alpha features in their definitions,
+    repeated compilation is required. The result only depends on the
+    arguments, so it is cached rather than recompiled at every use.
+    '''
+    template = TOKEN_FAMILIES[family][direction]
+    template = template.replace('\*', str(arg))
+    return fixed_point_translation(template)
+
 def next_number(s, index):
     '''Find the next integer argument after the `index` in `s`'''
 
     # skips any non-valid characters
-    index += len(list(it.takewhile(lambda x: not x.isdigit()
-                                   and x not in OLD_TOKENS
-                                   and x not in TOKEN_FAMILIES
-                                   and x not in EXTENDED_TOKENS, s[index:])))
+    while (index < len(s) and not s[index].isdigit()
+           and s[index] not in OLD_TOKENS
+           and s[index] not in TOKEN_FAMILIES
+           and s[index] not in EXTENDED_TOKENS):
+        index += 1
     # gets as many digits as can be found
-    num = ''.join(it.takewhile(lambda x: x.isdigit(), s[index:]))
-    index += len(num)
+    start = index
+    while index < len(s) and s[index].isdigit():
+        index += 1
+    num = s[start:index]
     # if no argument is found, default to 1
     return (int(num) if num else 1, index)
 
@@ -101,11 +116,7 @@ def translate(s):
             # the direction. No validation is done at the moment.
             direction = s[i + 1]
             arg, index = next_number(s, i + 2)
-            template = TOKEN_FAMILIES[s[i]][direction]
-            template = template.replace('\*', str(arg))
-            # Since some of these use BF Alpha features in their
-            # definitions, repeated compilation is required
-            yield fixed_point_translation(template)
+            yield expand_family(s[i], direction, arg)
             i = index
         else: i += 1 # ignore non-valid characters
 
@@ -0,0 +1,217 @@
+'''Run one brainfuck program over many separate inputs
+
+The code is compiled once into a `Program`: it is minimized, runs of the
+same command are collapsed into a single instruction with a count, and
+every loop jump is resolved ahead of time. The same `Program` can then be
+run over any number of inputs (or "lanes") without repeating that work.
+
+For large batches the inputs can be split into chunks and spread over
+worker processes. Each worker receives the compiled program once, when
+it starts, rather than once per input.
+
+Unlike `brainfuck.eval`, nothing is printed and nothing is read from
+stdin. Each lane reads `,` from its own input string and collects its
+`.` output into a string. Reading past the end of the input raises the
+same `TypeError` that `brainfuck.eval` does.
+'''
+import sys
+import multiprocessing
+from brainfuck import Memory, CELL_SIZE, minimize, jump_table
+
+# commands that can be collapsed into one instruction with a count
+REPEATABLE = ('+', '-', '>', '<')
+
+
+def compile(code):
+    '''Compile brainfuck code into a list of `(command, argument)` pairs
+
+    For `+`, `-`, `>` and `<` the argument is how many times the command
+    is repeated. For `[` and `]` it is the index of the matching bracket
+    in the instruction list. `.` and `,` take no argument.
+    '''
+    instructions = []
+    for c in minimize(code):
+        if c in REPEATABLE:
+            if instructions and instructions[-1][0] == c:
+                instructions[-1][1] += 1
+            else:
+                instructions.append([c, 1])
+        elif c in ('[', ']', '.', ','):
+            instructions.append([c, None])
+    jumps = jump_table([cmd for cmd, _ in instructions])
+    for i, j in jumps.items():
+        instructions[i][1] = j
+    return [tuple(instruction) for instruction in instructions]
+
+
+def snapshot(mem, end=None):
+    '''Get the used part of the tape and the pointer from a Memory
+
+    The tape is cut after the last non-zero cell, so the result is small
+    enough to keep around for every lane in a batch. If it is known that
+    no cell from `end` onwards was ever used, only the cells before it
+    are searched.
+    '''
+    if end is None:
+        end = len(mem.memory)
+    end = min(end, len(mem.memory))
+    while end > 0 and mem.memory[end - 1] == 0:
+        end -= 1
+    return mem.memory[:end], mem.ptr
+
+
+class Program:
+    '''Brainfuck code compiled once so it can be run on many inputs'''
+
+    def __init__(self, code):
+        self.code = code
+        self.instructions = compile(code)
+
+    def run(self, input_string='', mem=None):
+        '''Run the program on one input, returning the output and Memory'''
+        if mem is None:
+            mem = Memory()
+        output, _ = self.execute(input_string, mem)
+        return output, mem
+
+    def execute(self, input_string, mem):
+        '''Run the program on one input using `mem`
+
+        Returns the output and the furthest right cell the pointer
+        reached, so the caller knows how much of the tape was used.
+        '''
+        memory = mem.memory
+        ptr = mem.ptr
+        furthest = ptr
+        instructions = self.instructions
+        output = []
+        input_index = 0
+        cmd_index = 0
+        while cmd_index < len(instructions):
+            cmd, arg = instructions[cmd_index]
+            if cmd == '+':
+                memory[ptr] = (memory[ptr] + arg) % CELL_SIZE
+            elif cmd == '-':
+                memory[ptr] = (memory[ptr] - arg) % CELL_SIZE
+            elif cmd == '>':
+                ptr += arg
+                if ptr > furthest:
+                    furthest = ptr
+            elif cmd == '<':
+                ptr = max(ptr - arg, 0)
+            elif cmd == '[':
+                if memory[ptr] == 0:
+                    cmd_index = arg
+            elif cmd == ']':
+                if memory[ptr] != 0:
+                    cmd_index = arg
+            elif cmd == '.':
+                output.append(chr(memory[ptr]))
+            elif cmd == ',':
+                # as with `brainfuck.eval`, reading past the end of the
+                # input fails with the `TypeError` from `ord('')`
+                char = input_string[input_index:input_index + 1]
+                memory[ptr] = ord(char) % CELL_SIZE
+                input_index += 1
+            cmd_index += 1
+        mem.ptr = ptr
+        return ''.join(output), furthest
+
+
+class BatchResult:
+    '''Outputs and final tapes of a batched run, one entry per lane
+
+    `tapes` holds the tape of each lane as trimmed by `snapshot`, and
+    `pointers` the final data pointer of each lane. `errors` holds the
+    exception a lane failed with, or None if it finished; the output,
+    tape and pointer of a failed lane are all None.
+    '''
+
+    def __init__(self, outputs=(), tapes=(), pointers=(), errors=()):
+        self.outputs = list(outputs)
+        self.tapes = list(tapes)
+        self.pointers = list(pointers)
+        self.errors = list(errors)
+
+    def __len__(self):
+        return len(self.outputs)
+
+    def __iter__(self):
+        return zip(self.outputs, self.tapes, self.pointers)
+
+    def __getitem__(self, index):
+        return self.outputs[index], self.tapes[index], self.pointers[index]
+
+    def __repr__(self):
+        return 'BatchResult({} lanes)'.format(len(self))
+
+
+def run_lane(program, input_string):
+    '''Run `program` on one input and get `(output, tape, pointer)`'''
+    mem = Memory()
+    output, furthest = program.execute(input_string, mem)
+    # a fresh Memory is all zeros past the furthest cell reached
+    return (output,) + snapshot(mem, furthest + 1)
+
+
+def _try_lane(program, input_string):
+    # one failing lane shouldn't lose the results of all the others, so
+    # its exception is kept in place of its results
+    try:
+        return run_lane(program, input_string) + (None,)
+    except Exception as e:
+        return None, None, None, e
+
+
+# the compiled program of a worker process, set once when it starts
+_worker_program = None
+
+
+def _init_worker(program):
+    global _worker_program
+    _worker_program = program
+
+
+def _run_chunk(inputs):
+    return [_try_lane(_worker_program, s) for s in inputs]
+
+
+def eval_batch(code, inputs, processes=None, chunksize=64):
+    '''Run brainfuck code over every string in `inputs`
+
+    `code` may be source code or an already compiled `Program`. If
+    `processes` is given the inputs are split into chunks of `chunksize`
+    and run in that many worker processes, otherwise they are run one
+    after another in this process. Either way the lanes come back in the
+    same order as `inputs`, gathered in a single `BatchResult`. A lane
+    that raises an exception doesn't stop the others; the exception is
+    kept in the result's `errors`.
+    '''
+    program = code if isinstance(code, Program) else Program(code)
+    inputs = list(inputs)
+    if processes:
+        chunks = [inputs[i:i + chunksize]
+                  for i in range(0, len(inputs), chunksize)]
+        with multiprocessing.Pool(processes, _init_worker,
+                                  (program,)) as pool:
+            lanes = [lane for chunk in pool.map(_run_chunk, chunks)
+                     for lane in chunk]
+    else:
+        lanes = [_try_lane(program, s) for s in inputs]
+    return BatchResult(*zip(*lanes))
+
+
+if __name__ == '__main__':
+    # usage: bf_batch.py program.bf [processes] < inputs
+    # each line of stdin is run as a separate input
+    if len(sys.argv) < 2:
+        print('usage: {} program.bf [processes] < inputs'.format(
+            sys.argv[0]))
+        sys.exit(1)
+    with open(sys.argv[1], 'r') as program_file:
+        code = program_file.read()
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    inputs = [line.rstrip('\n') for line in sys.stdin]
+    result = eval_batch(code, inputs, processes)
+    for output, error in zip(result.outputs, result.errors):
+        print(output if error is None else 'error: {!r}'.format(error))
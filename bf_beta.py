@@ -21,12 +21,23 @@ The exclamation points mark "mutating" functions, as in Common Lisp.
 `=` is `set-to`.
 `[` and `]` are replaced with `while-n-0`, which is just the same as
     enclosing its argument (which is code) in a `[]` pair.
+
+Macros can be defined with `defmacro`, which takes a name, a list of
+parameters and a body:
+
+    (defmacro move-to (n) (move-relative n) (> n))
+
+After which `(move-to 2)` is the same as writing out the body with
+every `n` replaced by `2`. Each expansion is compiled once per distinct
+argument list and reused at every other call site with the same
+arguments.
 '''
 import itertools as it
 import sys
 import bf_alpha
 from bf_alpha import Memory
-from lisp_core import listify, Atom, ConsCell, lisp_parse, progn, all_matched
+from lisp_core import (listify, Atom, ConsCell, lisp_parse, progn,
+                       all_matched, substitute)
 from functools import reduce
 
 CORE_FUNCTIONS = {
@@ -58,13 +69,43 @@ NO_ARGUMENT_FUNCTIONS = {
 }
 
 
-def compile(parse_tree):
+class Macro:
+    '''A user-defined function, expanded at compile time
+
+    Expansions are memoized by their arguments. The cached result is
+    the body compiled to BF Alpha, which stays short; lowering it to
+    brainfuck is cheap since `bf_alpha.expand_family` is cached too.
+    '''
+    def __init__(self, name, params, body):
+        self.name = name
+        self.params = [param.string for param in listify(params)]
+        self.body = body
+        self.expansions = {}
+
+    def expand(self, args, macros):
+        '''Get the BF Alpha for a call of this macro with `args`'''
+        args = list(args)
+        if len(args) != len(self.params):
+            raise RuntimeError('{} takes {} arguments, got {}'.format(
+                self.name, len(self.params), len(args)))
+        key = tuple(str(arg) for arg in args)
+        if key not in self.expansions:
+            # the body is substituted as a `progn`, so that the first
+            # call in it is an argument rather than the function
+            body = substitute(progn(self.body), dict(zip(self.params, args)))
+            self.expansions[key] = ''.join(compile(body, macros))
+        return self.expansions[key]
+
+
+def compile(parse_tree, macros=None):
     '''Compile an AST of lisp-like BF Beta to BF Alpha
     
     For the most part performing simple translations from the
-    `CORE_FUNCTIONS` dict.
+    `CORE_FUNCTIONS` dict. Macros defined with `defmacro` are added to
+    `macros`, a dict from name to `Macro`.
     '''
-    print(parse_tree)
+    if macros is None:
+        macros = {}
     if isinstance(parse_tree.car, Atom):
         # the first item in a "code" s-exp should be the called function
         # since this isn't a true lisp there's no way for another s-exp
@@ -75,7 +116,21 @@ def compile(parse_tree):
             # in the body individually
             parse_tree = parse_tree.cdr
             for node in listify(parse_tree):
-                yield from compile(node)
+                yield from compile(node, macros)
+        elif function == 'defmacro':
+            # (defmacro name (params...) body...) produces no code, it
+            # only makes `name` callable from here on
+            name, params = parse_tree.cdr.car, parse_tree.cdr.cdr.car
+            body = parse_tree.cdr.cdr.cdr
+            if name.string in macros or name.string in CORE_FUNCTIONS:
+                # other macros may have expanded calls to the old
+                # definition (a macro, or the core function this now
+                # shadows), so none of their cached expansions hold
+                for macro in macros.values():
+                    macro.expansions.clear()
+            macros[name.string] = Macro(name.string, params, body)
+        elif function in macros:
+            yield macros[function].expand(listify(parse_tree.cdr), macros)
         elif function in CORE_FUNCTIONS:
             if function == 'while-n-0':
                 # while-n-0 just creates a normal brainfuck loop around
@@ -83,7 +138,7 @@ def compile(parse_tree):
                 # is wrapped in it (as that's the only way to do code
                 # blocks in BF Beta)
                 yield '['
-                yield from compile(progn(parse_tree.cdr))
+                yield from compile(progn(parse_tree.cdr), macros)
                 yield ']'
             elif function in NO_ARGUMENT_FUNCTIONS:
                 yield CORE_FUNCTIONS[function]
@@ -100,32 +155,36 @@ def compile(parse_tree):
                     modifier = 'f' if int(arg) > 0 else 'b'
                     arg = str(abs(int(arg)))
                 yield CORE_FUNCTIONS[function] + modifier + arg 
+        else:
+            raise RuntimeError('Unknown function: {}'.format(function))
     else:
         raise RuntimeError('Unknown function: {}'.format(parse_tree.car))
 
 
-def eval(code, mem):
+def eval(code, mem, macros=None):
     '''Parse code into a cons-cell tree structure, then evaluate it'''
     parse_tree = lisp_parse(code)
-    return eval_tree(parse_tree, mem)
+    return eval_tree(parse_tree, mem, macros)
 
 
-def eval_tree(parse_tree, mem):
+def eval_tree(parse_tree, mem, macros=None):
     '''Get the compiled BF Alpha code from the parse_tree and run it'''
-    compilation = ''.join(compile(parse_tree))
+    compilation = ''.join(compile(parse_tree, macros))
     return bf_alpha.eval(compilation, mem)
 
 
 def repl():
     '''REPL Brainfuck Beta code'''
     mem = Memory()
+    # macros stay defined between lines
+    macros = {}
     while True:
         print(mem)
         code = input("| ")
         if not all_matched(code):
             while not all_matched(code):
                 code += input("..| ")
-        output = eval(code, mem)
+        output = eval(code, mem, macros)
         if output:
             print()
 
@@ -0,0 +1,409 @@
+'''Check that every way of running brainfuck agrees, and how fast each is
+
+Random brainfuck programs are run through each engine in `ENGINES` on
+random and fuzzed inputs. Every engine must give the same output, final
+tape and final pointer as the first one, the plain `brainfuck.eval`.
+The time each engine takes is recorded too, and can be compared against
+timings saved from an earlier run to flag speed regressions.
+
+A third of the programs are "tame": the only `-` is the one that counts
+down a loop, loop bodies never touch their own counter and always
+return the pointer to where it started, so they always halt and
+`bf_layout` can rearrange all of them. Another third are "wild":
+random commands and loops with nothing held back, so they cover cell
+wraparound, `<` at the first cell, tape-scanning loops and running out
+of input. The rest are "mixed": a tame program followed by code that
+scans the tape or runs into the first cell, so `bf_layout` can only
+rearrange the tame part and must leave the cells the rest reads alone.
+Wild and mixed cases that don't halt within `STEP_LIMIT` steps are
+skipped. An engine can also report that a case is `NOT_APPLICABLE` to
+it, in which case it isn't compared.
+
+Run as a script it checks a batch of programs and exits with status 1
+if any engine disagrees or got slower than the saved timings allow.
+Saved timings record the seed and number of programs they came from,
+and are only compared against runs over the same programs.
+'''
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+from collections import Counter
+import brainfuck
+import bf_alpha
+import bf_beta
+import bf_batch
+import bf_layout
+from brainfuck import Memory
+
+# instructions a wild case may run before it's assumed not to halt
+STEP_LIMIT = 20000
+
+# returned by an engine for cases it can't run
+NOT_APPLICABLE = 'not applicable'
+
+# the same programs are generated on every run unless asked otherwise,
+# so that timings from different runs can be compared
+DEFAULT_SEED = 0
+DEFAULT_COUNT = 100
+
+
+def random_program(rng, length=30, depth=2):
+    '''Generate a random brainfuck program that is sure to halt'''
+    return _random_block(rng, length, depth, top_level=True)
+
+
+def _random_block(rng, length, depth, top_level=False):
+    # the pointer is kept relative to the start of the block, and never
+    # goes left of it so a loop body can't reach its own counter
+    result = []
+    ptr = 0
+    for _ in range(length):
+        choice = rng.random()
+        if choice < 0.35:
+            result.append('+' * rng.randint(1, 5))
+        elif choice < 0.55:
+            step = rng.randint(1, 3)
+            result.append('>' * step)
+            ptr += step
+        elif choice < 0.7 and ptr > 0:
+            step = rng.randint(1, ptr)
+            result.append('<' * step)
+            ptr -= step
+        elif choice < 0.8:
+            result.append('.')
+        elif choice < 0.85:
+            # clearing a cell, which inside a loop that doesn't run
+            # leaves the cell as it was
+            result.append('[-]')
+        elif choice < 0.92 and top_level:
+            result.append(',')
+        elif depth > 0:
+            # a loop counting down the current cell, with a body that
+            # only works on cells to the right of it
+            step = rng.randint(1, 2)
+            body = _random_block(rng, length // 3, depth - 1)
+            result.append('[-' + '>' * step + body + '<' * step + ']')
+    if not top_level:
+        result.append('<' * ptr)
+    return ''.join(result)
+
+
+def random_wild_program(rng, length=20, depth=2):
+    '''Generate a random brainfuck program, which may not halt'''
+    result = []
+    for _ in range(length):
+        if depth > 0 and rng.random() < 0.15:
+            body = random_wild_program(rng, length // 2, depth - 1)
+            result.append('[' + body + ']')
+        else:
+            result.append(rng.choice('+-<>.,'))
+    return ''.join(result)
+
+
+# endings for mixed programs that the layout pass can't follow, which
+# between them read back every cell the tame part left non-zero
+SCANNING_ENDINGS = [
+    '[.>]',
+    '>[.>]',
+    '[<].>.>.>.>.>.',
+    '[.<]' + '.>' * 12,
+    '<' * 100 + '.>' * 12,
+]
+
+
+def random_mixed_program(rng):
+    '''Generate a tame program with an ending `bf_layout` can't follow
+
+    The ending may keep the program from halting.
+    '''
+    ending = rng.choice(SCANNING_ENDINGS + [random_wild_program(rng)])
+    return random_program(rng) + ending
+
+
+def halts(code, input_string, limit=STEP_LIMIT):
+    '''Check that code finishes (or fails) within `limit` instructions'''
+    instructions = bf_batch.compile(code)
+    memory = {}
+    ptr = 0
+    input_index = 0
+    cmd_index = 0
+    for _ in range(limit):
+        if cmd_index >= len(instructions):
+            return True
+        cmd, arg = instructions[cmd_index]
+        cell = memory.get(ptr, 0)
+        if cmd == '+':
+            memory[ptr] = (cell + arg) % brainfuck.CELL_SIZE
+        elif cmd == '-':
+            memory[ptr] = (cell - arg) % brainfuck.CELL_SIZE
+        elif cmd == '>':
+            ptr += arg
+        elif cmd == '<':
+            ptr = max(ptr - arg, 0)
+        elif cmd == '[' and cell == 0 or cmd == ']' and cell != 0:
+            cmd_index = arg
+        elif cmd == ',':
+            if input_index >= len(input_string):
+                # the engines all fail here, which is a result too
+                return True
+            memory[ptr] = ord(input_string[input_index])
+            input_index += 1
+        cmd_index += 1
+    return False
+
+
+def random_input(rng, length):
+    '''Generate a random input string of `length` characters'''
+    return ''.join(chr(rng.randint(32, 126)) for _ in range(length))
+
+
+def fuzzed_inputs(rng, length):
+    '''Generate inputs of about `length` characters of edge case values
+
+    One is shorter than `length`, so programs reading `length`
+    characters run out of input.
+    '''
+    yield '\x00' * length
+    yield '\xff' * length
+    yield ''.join(rng.choice('\x00\x01\n\x7f\x80\xff')
+                  for _ in range(length))
+    yield random_input(rng, rng.randint(0, max(length - 1, 0)))
+
+
+def to_beta(code):
+    '''Translate brainfuck code to equivalent BF Beta source'''
+    names = {'.': '(output)', ',': '(input)'}
+    result = ['(progn']
+    i = 0
+    while i < len(code):
+        c = code[i]
+        if c in ('+', '-', '>', '<'):
+            run = len(code[i:]) - len(code[i:].lstrip(c))
+            result.append('({} {})'.format(c, run))
+            i += run
+            continue
+        elif c == '[':
+            result.append('(while-n-0')
+        elif c == ']':
+            result.append(')')
+        elif c in names:
+            result.append(names[c])
+        i += 1
+    result.append(')')
+    return ' '.join(result)
+
+
+def _run_printing(function, code, input_string):
+    # runs an eval that prints its output and reads from stdin
+    mem = Memory()
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(input_string)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = function(code, mem)
+    finally:
+        sys.stdin = stdin
+    return (output,) + bf_batch.snapshot(mem)
+
+
+def run_brainfuck(code, input_string):
+    return _run_printing(brainfuck.eval, code, input_string)
+
+
+def run_alpha(code, input_string):
+    return _run_printing(bf_alpha.eval, code, input_string)
+
+
+def run_beta(code, input_string):
+    return _run_printing(bf_beta.eval, to_beta(code), input_string)
+
+
+def run_batch(code, input_string):
+    return bf_batch.run_lane(bf_batch.Program(code), input_string)
+
+
+def run_layout(prepared, input_string):
+    '''Run code rewritten by `bf_layout`, putting the tape back in order'''
+    new_code, report = prepared
+    output, tape, ptr = bf_batch.run_lane(bf_batch.Program(new_code),
+                                          input_string)
+    if not report['static']:
+        # only the start was rearranged, and the tape put back after it
+        return output, tape, ptr
+    mapping = report['mapping']
+    original = [0] * (max(mapping) + 1)
+    for cell, position in mapping.items():
+        if position < len(tape):
+            original[cell] = tape[position]
+    while original and original[-1] == 0:
+        original.pop()
+    unmapped = {position: cell for cell, position in mapping.items()}
+    return output, original, unmapped[ptr]
+
+
+# Each engine is a pair of functions. The second takes brainfuck code and
+# an input string, and returns the output, the final tape (as from
+# `bf_batch.snapshot`) and the pointer. If the first isn't None, it is
+# given the code and input first, timed separately, and what it returns
+# is passed on in place of the code.
+ENGINES = {
+    'brainfuck': (None, run_brainfuck),
+    'alpha': (None, run_alpha),
+    'beta': (None, run_beta),
+    'batch': (None, run_batch),
+    'layout': (bf_layout.optimize_layout, run_layout),
+}
+
+
+def outcome(function, code, input_string):
+    '''Call an engine function, turning exceptions into comparable results
+
+    Exceptions are compared by both their type and message.
+    '''
+    try:
+        return function(code, input_string)
+    except Exception as e:
+        return _error(e)
+
+
+def _error(exception):
+    return ('error', type(exception).__name__, str(exception))
+
+
+def check(cases, engines=ENGINES):
+    '''Run every `(code, input)` case through every engine
+
+    Returns a list of mismatches, as `(code, input, engine, expected,
+    got)` tuples compared against the first engine, a dict of the total
+    seconds each engine took, and a Counter of how many cases each
+    engine found not applicable. Time spent preparing is recorded under
+    the engine's name followed by ` pass`.
+    '''
+    mismatches = []
+    timings = {}
+    for name, (prepare, _) in engines.items():
+        if prepare is not None:
+            timings[name + ' pass'] = 0.0
+        timings[name] = 0.0
+    not_applicable = Counter()
+    for code, input_string in cases:
+        expected = None
+        for name, (prepare, run) in engines.items():
+            prepared = code
+            result = None
+            if prepare is not None:
+                start = time.perf_counter()
+                try:
+                    prepared = prepare(code, input_string)
+                except Exception as e:
+                    result = _error(e)
+                timings[name + ' pass'] += time.perf_counter() - start
+                if prepared == NOT_APPLICABLE:
+                    result = NOT_APPLICABLE
+            if result is None:
+                start = time.perf_counter()
+                result = outcome(run, prepared, input_string)
+                timings[name] += time.perf_counter() - start
+            if result == NOT_APPLICABLE:
+                not_applicable[name] += 1
+            elif expected is None:
+                expected = result
+            elif result != expected:
+                mismatches.append((code, input_string, name,
+                                   expected, result))
+    return mismatches, timings, not_applicable
+
+
+def random_cases(count, seed=None):
+    '''Generate `count` random programs, each with several inputs
+
+    Programs take turns being tame, wild and mixed, and only the wild
+    and mixed cases that halt are kept.
+    '''
+    generators = [random_program, random_wild_program, random_mixed_program]
+    rng = random.Random(seed)
+    for i in range(count):
+        tame = i % 3 == 0
+        code = generators[i % 3](rng)
+        reads = code.count(',')
+        inputs = [random_input(rng, reads)] + list(fuzzed_inputs(rng, reads))
+        for input_string in inputs:
+            if tame or halts(code, input_string):
+                yield code, input_string
+
+
+def regressions(timings, baseline, tolerance=0.25):
+    '''Find engines that got slower than `baseline` allows
+
+    An engine regressed if it took more than `tolerance` (as a fraction)
+    longer than its baseline time. Returns `(engine, seconds,
+    baseline_seconds)` tuples.
+    '''
+    return [(name, seconds, baseline[name])
+            for name, seconds in timings.items()
+            if name in baseline
+            and seconds > baseline[name] * (1 + tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--count', type=int, default=None,
+                        help='number of random programs to check '
+                        '(default {})'.format(DEFAULT_COUNT))
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the random programs '
+                        '(default {})'.format(DEFAULT_SEED))
+    parser.add_argument('--baseline',
+                        help='JSON file of timings to compare against, '
+                        'whose seed and count are used by default')
+    parser.add_argument('--save', help='write the timings to this file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown as a fraction of baseline')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        # timings are only comparable if they come from the same programs
+        for key in ('seed', 'count'):
+            if key not in baseline:
+                parser.error('baseline has no {}'.format(key))
+            if getattr(args, key) is None:
+                setattr(args, key, baseline[key])
+            elif getattr(args, key) != baseline[key]:
+                parser.error('baseline was made with {} {}, not {}'.format(
+                    key, baseline[key], getattr(args, key)))
+    if args.seed is None:
+        args.seed = DEFAULT_SEED
+    if args.count is None:
+        args.count = DEFAULT_COUNT
+
+    mismatches, timings, not_applicable = check(
+        random_cases(args.count, args.seed))
+    for code, input_string, name, expected, got in mismatches:
+        print('MISMATCH in {} for {!r} on input {!r}:'.format(
+            name, code, input_string))
+        print('    expected {!r}'.format(expected))
+        print('    got      {!r}'.format(got))
+    for name, seconds in timings.items():
+        print('{:<12} {:.3f}s'.format(name, seconds))
+    for name, cases in not_applicable.items():
+        print('{} not applicable to {} cases'.format(name, cases))
+
+    slow = []
+    if baseline is not None:
+        slow = regressions(timings, baseline['timings'], args.tolerance)
+        for name, seconds, before in slow:
+            print('REGRESSION in {}: {:.3f}s, baseline {:.3f}s'.format(
+                name, seconds, before))
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump({'seed': args.seed, 'count': args.count,
+                       'timings': timings}, save_file, indent=4)
+    if mismatches or slow:
+        sys.exit(1)
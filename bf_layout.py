@@ -0,0 +1,319 @@
+'''Rearrange the cells used by brainfuck code to cut pointer movement
+
+Generated brainfuck, such as the output of `brainfuck_encode` or the BF
+Alpha `mf`/`af` templates, keeps its temporaries at fixed offsets. That
+means a lot of `>>>>` and `<<<<` to go back and forth between cells that
+are used together, and unused gaps on the tape.
+
+This pass runs the code once to count how often the pointer travels
+between each pair of cells, then picks a new position for every cell so
+that cells used together sit next to each other, and rewrites the code
+for that layout. That needs the cell every command touches to be known
+before running, i.e. every loop leaves the pointer where it found it.
+
+Code often ends with a part where that isn't true, like the `[.>]` that
+`brainfuck_encode.loop_encode` prints with. Only the part before the
+first such loop is rearranged, and the rest is kept as it is. Every cell
+that part could see must then be back in its original place: cells that
+are still in use keep their positions, and only cells known to be zero
+by then (loop counters and other temporaries) are moved around.
+
+The rewritten code gives the same output. If the whole code could be
+rearranged the final tape has its cells in the new order, and the report
+includes the mapping between them; otherwise the final tape is the same.
+'''
+import sys
+from collections import Counter
+from brainfuck import Memory, CELL_SIZE, minimize, jump_table
+import bf_batch
+
+
+def cell_trace(code):
+    '''Find the cell each command works on, relative to the start
+
+    Returns a list of `(command, cell)` pairs for every command that is
+    not a move, the cell the pointer is at after them, and the rest of
+    the code. The trace stops at the first loop that doesn't return the
+    pointer to where it started (or the first move left of the starting
+    cell) and everything from there on is returned as the rest.
+    '''
+    code = minimize(code)
+    # checks that the brackets match before relying on them below
+    jump_table(code)
+    ptr = 0
+    # the code index, trace length and pointer at each open loop
+    loop_starts = []
+    trace = []
+    for i, c in enumerate(code):
+        leaves_tape = c == '<' and ptr == 0
+        unbalanced = c == ']' and loop_starts[-1][2] != ptr
+        if leaves_tape or unbalanced:
+            # stops before the outermost loop this is in, if any
+            i, length, ptr = loop_starts[0] if loop_starts else (
+                i, len(trace), ptr)
+            return trace[:length], ptr, code[i:]
+        if c == '>':
+            ptr += 1
+        elif c == '<':
+            ptr -= 1
+        elif c == '[':
+            loop_starts.append((i, len(trace), ptr))
+            trace.append((c, ptr))
+        elif c == ']':
+            loop_starts.pop()
+            trace.append((c, ptr))
+        elif c in ('+', '-', '.', ','):
+            trace.append((c, ptr))
+    return trace, ptr, ''
+
+
+def profile(code, input_string=''):
+    '''Run code, counting how often the pointer travels between cells
+
+    Returns a Counter from `(from_cell, to_cell)` to the number of times
+    that move was executed in the part of the code `cell_trace` could
+    follow, the number of moves executed in the rest, and the furthest
+    right cell the pointer reached in the whole run. The run uses a
+    tape the same size as a `Memory`, so it fails with an `IndexError`
+    where `brainfuck.eval` would.
+    '''
+    trace, end, rest = cell_trace(code)
+    jumps = jump_table([cmd for cmd, _ in trace])
+    memory = [0] * Memory.MEMORY_SIZE
+    transitions = Counter()
+    ptr = 0
+    furthest = 0
+    input_index = 0
+    cmd_index = 0
+    while cmd_index < len(trace):
+        cmd, cell = trace[cmd_index]
+        if cell != ptr:
+            transitions[ptr, cell] += 1
+            ptr = cell
+            furthest = max(furthest, ptr)
+        if cmd == '+':
+            memory[ptr] = (memory[ptr] + 1) % CELL_SIZE
+        elif cmd == '-':
+            memory[ptr] = (memory[ptr] - 1) % CELL_SIZE
+        elif cmd == '[':
+            if memory[ptr] == 0:
+                cmd_index = jumps[cmd_index]
+        elif cmd == ']':
+            if memory[ptr] != 0:
+                cmd_index = jumps[cmd_index]
+        elif cmd == '.':
+            # nothing is printed, but the run should fail where a real
+            # one would on a value that isn't a character
+            chr(memory[ptr])
+        elif cmd == ',':
+            char = input_string[input_index:input_index + 1]
+            memory[ptr] = ord(char) % CELL_SIZE
+            input_index += 1
+        cmd_index += 1
+    if end != ptr:
+        transitions[ptr, end] += 1
+    ptr = end
+    furthest = max(furthest, ptr)
+
+    # the rest of the code is just run, counting the moves
+    rest_moves = 0
+    instructions = bf_batch.compile(rest)
+    cmd_index = 0
+    while cmd_index < len(instructions):
+        cmd, arg = instructions[cmd_index]
+        if cmd == '+':
+            memory[ptr] = (memory[ptr] + arg) % CELL_SIZE
+        elif cmd == '-':
+            memory[ptr] = (memory[ptr] - arg) % CELL_SIZE
+        elif cmd == '>':
+            rest_moves += arg
+            ptr += arg
+            furthest = max(furthest, ptr)
+        elif cmd == '<':
+            rest_moves += min(arg, ptr)
+            ptr = max(ptr - arg, 0)
+        elif cmd == '[':
+            if memory[ptr] == 0:
+                cmd_index = arg
+        elif cmd == ']':
+            if memory[ptr] != 0:
+                cmd_index = arg
+        elif cmd == '.':
+            chr(memory[ptr])
+        elif cmd == ',':
+            char = input_string[input_index:input_index + 1]
+            memory[ptr] = ord(char) % CELL_SIZE
+            input_index += 1
+        cmd_index += 1
+    return transitions, rest_moves, furthest
+
+
+def moves(transitions, positions=None):
+    '''Count the `>` and `<` executed for some profiled transitions
+
+    If `positions` is given, count them as if each cell were moved to
+    `positions[cell]`.
+    '''
+    if positions is None:
+        return sum(n * abs(a - b) for (a, b), n in transitions.items())
+    # the pointer still starts at the left end of the tape, so getting
+    # to where the starting cell was moved to also costs moves
+    return positions[0] + sum(n * abs(positions[a] - positions[b])
+                              for (a, b), n in transitions.items())
+
+
+def zeroed_cells(trace):
+    '''Find the cells known to be zero after the commands in `trace`
+
+    These are the cells whose last use was to end a loop that isn't
+    inside another loop, which only happens once the cell is zero. The
+    end of a loop inside another one proves nothing, since the outer
+    loop may never have run it.
+    '''
+    last = {}
+    depth = 0
+    for cmd, cell in trace:
+        if cmd == '[':
+            depth += 1
+        elif cmd == ']':
+            depth -= 1
+        last[cell] = cmd == ']' and depth == 0
+    return {cell for cell, zeroed in last.items() if zeroed}
+
+
+def _weights(transitions):
+    # how often the pointer travels between each pair of cells, and how
+    # often it travels to or from each cell at all
+    weights = Counter()
+    for (a, b), n in transitions.items():
+        weights[a, b] += n
+        weights[b, a] += n
+    busyness = Counter()
+    for (a, _), n in weights.items():
+        busyness[a] += n
+    return weights, busyness
+
+
+def arrange(cells, transitions):
+    '''Order cells so that those used together sit close together
+
+    Starting with the busiest cell, the unplaced cell that the pointer
+    travels to and from the placed cells most often is added to
+    whichever end of the row makes the added travel smallest. Returns a
+    dict from each cell to its new position.
+    '''
+    weights, busyness = _weights(transitions)
+    unplaced = sorted(cells, key=lambda cell: (-busyness[cell], cell))
+    row = [unplaced.pop(0)]
+    while unplaced:
+        cell = max(unplaced, key=lambda x: sum(weights[x, c] for c in row))
+        unplaced.remove(cell)
+        left = sum(weights[cell, c] * (i + 1) for i, c in enumerate(row))
+        right = sum(weights[cell, c] * (len(row) - i)
+                    for i, c in enumerate(row))
+        if left < right:
+            row.insert(0, cell)
+        else:
+            row.append(cell)
+    return {cell: i for i, cell in enumerate(row)}
+
+
+def arrange_around(cells, transitions, pinned):
+    '''Like `arrange`, but the `pinned` cells keep their positions
+
+    The other cells are placed one at a time, in the same order as in
+    `arrange`, at whichever free position makes the added travel to the
+    cells already placed smallest.
+    '''
+    weights, busyness = _weights(transitions)
+    positions = {cell: cell for cell in pinned}
+    unplaced = sorted(set(cells) - set(pinned),
+                      key=lambda cell: (-busyness[cell], cell))
+    free = [i for i in range(max(cells) + 1) if i not in positions]
+    while unplaced:
+        cell = max(unplaced,
+                   key=lambda x: sum(weights[x, c] for c in positions))
+        unplaced.remove(cell)
+        position = min(free, key=lambda p: (
+            sum(weights[cell, c] * abs(p - q)
+                for c, q in positions.items()), p))
+        free.remove(position)
+        positions[cell] = position
+    return positions
+
+
+def move(start, end):
+    '''Brainfuck to move the pointer from cell `start` to `end`'''
+    return '>' * (end - start) if end > start else '<' * (start - end)
+
+
+def relayout(code, positions):
+    '''Rewrite code so each cell is used at `positions[cell]` instead
+
+    Only the part of the code `cell_trace` could follow is rewritten;
+    the rest is added on unchanged.
+    '''
+    trace, end, rest = cell_trace(code)
+    result = []
+    ptr = 0
+    for cmd, cell in trace:
+        result.append(move(ptr, positions[cell]))
+        result.append(cmd)
+        ptr = positions[cell]
+    result.append(move(ptr, positions[end]))
+    result.append(rest)
+    return ''.join(result)
+
+
+def optimize_layout(code, input_string=''):
+    '''Rearrange the cells of code to reduce executed pointer moves
+
+    The code is profiled by running it on `input_string`. Returns the
+    rewritten code and a report dict with the executed moves and number
+    of cells the pointer reached (including any the unchanged rest of
+    the code reached) before and after, the `mapping` from old cells to
+    new ones, and whether the code was `static` all the way through (and
+    so whether the final tape is reordered). If no better layout is found
+    the code is returned as is.
+    '''
+    trace, end, rest = cell_trace(code)
+    cells = {0, end} | {cell for _, cell in trace}
+    transitions, rest_moves, furthest = profile(code, input_string)
+    if rest:
+        # the rest of the code must see every cell that could still
+        # matter, and the pointer, where they were
+        pinned = (cells - zeroed_cells(trace)) | {end}
+        positions = arrange_around(cells, transitions, pinned)
+    else:
+        positions = arrange(cells, transitions)
+    if moves(transitions, positions) >= moves(transitions):
+        positions = {cell: cell for cell in cells}
+        new_code = code
+    else:
+        new_code = relayout(code, positions)
+    new_transitions, new_rest_moves, new_furthest = profile(new_code,
+                                                            input_string)
+    report = {
+        'moves_before': moves(transitions) + rest_moves,
+        'moves_after': moves(new_transitions) + new_rest_moves,
+        'cells_before': furthest + 1,
+        'cells_after': new_furthest + 1,
+        'mapping': positions,
+        'static': not rest,
+    }
+    return new_code, report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: {} program.bf [input]'.format(sys.argv[0]))
+        sys.exit(1)
+    with open(sys.argv[1], 'r') as program_file:
+        code = program_file.read()
+    input_string = sys.argv[2] if len(sys.argv) > 2 else ''
+    new_code, report = optimize_layout(code, input_string)
+    print(new_code)
+    print('moves: {} -> {}'.format(report['moves_before'],
+                                   report['moves_after']), file=sys.stderr)
+    print('cells: {} -> {}'.format(report['cells_before'],
+                                   report['cells_after']), file=sys.stderr)
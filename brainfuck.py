@@ -84,6 +84,28 @@ def match_index(index, code, reverse=False, chars=('[', ']')):
             if nest_count == 0:
                 return i
 
+def jump_table(code, chars=('[', ']')):
+    '''Map every bracket index in `code` to the index of its match
+
+    This does the same work as `match_index` for every bracket at once,
+    so code that is run many times only has to search for matches once.
+    '''
+    open_, close_ = chars
+    jumps = {}
+    stack = []
+    for i, c in enumerate(code):
+        if c == open_:
+            stack.append(i)
+        elif c == close_:
+            if not stack:
+                raise SyntaxError('No matching bracket')
+            start = stack.pop()
+            jumps[start] = i
+            jumps[i] = start
+    if stack:
+        raise SyntaxError('No matching bracket')
+    return jumps
+
 def remove_pairs(string, pair):
     '''Remove sequential occurrences of canceling values
     
@@ -162,6 +162,25 @@ def progn(parse_tree):
     return ConsCell(Atom('progn'), parse_tree)
 
 
+def substitute(parse_tree, bindings):
+    '''Replace atoms in code with their values in `bindings`
+
+    `bindings` maps atom strings to the atoms or s-exprs that replace
+    them. Only arguments are replaced: the function at the start of each
+    s-expr is kept, so a binding named like a function doesn't change
+    which function is called. Everything else is copied unchanged.
+    '''
+    if isinstance(parse_tree, Atom):
+        return bindings.get(parse_tree.string, parse_tree)
+    elif not isinstance(parse_tree, ConsCell) or parse_tree.isnull():
+        return parse_tree
+    function = parse_tree.car
+    if not isinstance(function, Atom):
+        function = substitute(function, bindings)
+    return de_listify([function] + [substitute(arg, bindings)
+                                    for arg in listify(parse_tree.cdr)])
+
+
 def fixed_point(data, f):
     '''Get a fixed point of `f`, starting with `data`
 